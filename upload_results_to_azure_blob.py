@@ -1,158 +1,441 @@
 #!/usr/bin/env python3
 
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from azure.core.exceptions import ClientAuthenticationError, ServiceRequestError
+from azure.storage.blob import (
+    BlobServiceClient,
+    BlobClient,
+    BlobType,
+    ContainerClient,
+    ContentSettings,
+)
+from azure.core.pipeline.transport import RequestsTransport
+from azure.core.exceptions import (
+    ClientAuthenticationError,
+    HttpResponseError,
+    ResourceNotFoundError,
+    ServiceRequestError,
+    ServiceResponseError,
+)
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
-import glob
-import datetime
+import hashlib
+import mmap
+import random
+import socket
+import sys
 import time
 import argparse
+import atexit
+import functools
+import logging
+import logging.handlers
+import queue
+import threading
+import requests
 import yaml
+from urllib3.util.retry import Retry
+
+try:
+    # The adapter RequestsTransport mounts itself: 32 KiB socket writes
+    from azure.core.pipeline.transport._requests_basic import (
+        BiggerBlockSizeHTTPAdapter as _HTTPAdapter,
+    )
+except ImportError:  # older azure-core
+    _HTTPAdapter = requests.adapters.HTTPAdapter
+
+try:
+    from yaml import CSafeDumper as _YamlDumper, CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeDumper as _YamlDumper, SafeLoader as _YamlLoader
+
+logger = logging.getLogger("upload")
+
+_service_client = None
+_service_client_lock = threading.Lock()
+
+_DNS_CACHE_TTL = 60
+_dns_cache = {}
+_dns_cache_lock = threading.Lock()
+_uncached_getaddrinfo = socket.getaddrinfo
+
+
+def _configure_logging():
+    """
+    Log to stdout through a queue, so upload workers hand records off instead of
+    waiting on the stream; a listener thread does the actual writes.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    # Flush whatever is still queued when the script exits
+    atexit.register(listener.stop)
 
 
 def create_example_config_file(file_path):
     if os.path.exists(file_path):
-        print(
-            f"Error: File '{file_path}' already exists. Please specify a different location."
+        logger.error(
+            "Error: File '%s' already exists. Please specify a different location.",
+            file_path,
         )
         return False
 
     example_config = {
         "storage_account_name": "your_storage_account_name",
         "storage_account_key": "your_storage_account_key",
+        "use_aad": False,
         "container_name": "your_container_name",
         "opsview_system_id": "opsview_system_id",
         "directory": "/var/log/opsview",
         "max_retries": 3,
         "retry_delay": 5,
+        "retry_cap": 60,
+        "max_workers": 8,
+        "max_concurrency": 4,
+        "block_size_mb": 8,
     }
 
     try:
         with open(file_path, "w") as file:
             file.write("---\n")
-            yaml.dump(example_config, file, default_flow_style=False)
+            file.write(
+                "# Uploads are retried only by this script (max_retries, retry_delay,\n"
+                "# retry_cap); the Azure SDK's own retry policy is disabled.\n"
+                "# use_aad: true authenticates with DefaultAzureCredential instead of\n"
+                "# storage_account_key and needs the azure-identity package.\n"
+            )
+            yaml.dump(
+                example_config, file, Dumper=_YamlDumper, default_flow_style=False
+            )
             file.write("...\n")
-        print(f"Example config file created at: {file_path}")
+        logger.info("Example config file created at: %s", file_path)
         return True
     except IOError as e:
-        print(f"Error: Unable to create file at '{file_path}'. {e}")
+        logger.error("Error: Unable to create file at '%s'. %s", file_path, e)
         return False
 
 
 def load_config_from_yaml(yaml_file):
-    with open(yaml_file, "r") as file:
-        return yaml.safe_load(file)
+    with open(yaml_file, "rb") as file:
+        return yaml.load(file, Loader=_YamlLoader)
 
 
-def is_blob_service_available(
-    storage_account_name, storage_account_key, container_name
+def _cached_getaddrinfo(*args, **kwargs):
+    """
+    socket.getaddrinfo with results kept for _DNS_CACHE_TTL seconds, so the
+    parallel connections to the storage account share one lookup.
+    """
+    key = (args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    with _dns_cache_lock:
+        cached = _dns_cache.get(key)
+    if cached is not None and now - cached[0] < _DNS_CACHE_TTL:
+        return cached[1]
+    result = _uncached_getaddrinfo(*args, **kwargs)
+    with _dns_cache_lock:
+        _dns_cache[key] = (now, result)
+    return result
+
+
+def _build_service_client(
+    storage_account_name,
+    storage_account_key,
+    block_size_mb=8,
+    use_aad=False,
+    connection_pool_size=10,
 ):
+    """
+    Return the BlobServiceClient shared by the healthcheck and the uploads,
+    creating it on first use so its connection pool is reused.
+    block_size_mb: Size of each staged block; larger blocks mean fewer PUT Block
+    round-trips per archive.
+    use_aad: Authenticate with DefaultAzureCredential instead of the account key.
+    The credential caches its bearer token, so requests are not signed one by one.
+    connection_pool_size: Connections kept open to the storage account; should
+    cover every request in flight at once so parallel uploads don't reconnect.
+    """
+    global _service_client
+    with _service_client_lock:
+        if _service_client is None:
+            if use_aad:
+                # Only needed for AAD authentication, so imported on demand
+                try:
+                    from azure.identity import DefaultAzureCredential
+                except ImportError as e:
+                    raise ImportError(
+                        "use_aad requires the azure-identity package "
+                        "(pip install azure-identity)"
+                    ) from e
+
+                credential = DefaultAzureCredential()
+            else:
+                credential = storage_account_key
+
+            # Same adapter and retry settings RequestsTransport would mount for
+            # its own session, only with a larger pool
+            session = requests.Session()
+            adapter = _HTTPAdapter(
+                pool_maxsize=connection_pool_size,
+                max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            # Keep single-shot uploads small so every archive goes through the
+            # staged block path and max_concurrency applies. Retries, including
+            # read failures mid-block, are left to the uploader's own loop so
+            # the two layers don't multiply each other.
+            _service_client = BlobServiceClient(
+                account_url=f"https://{storage_account_name}.blob.core.windows.net",
+                credential=credential,
+                transport=RequestsTransport(session=session, session_owner=True),
+                max_single_put_size=4 * 1024 * 1024,
+                max_block_size=block_size_mb * 1024 * 1024,
+                retry_total=0,
+                retry_connect=0,
+                retry_read=0,
+                retry_status=0,
+            )
+        return _service_client
+
+
+def is_blob_service_available(container_client):
     """
     Check connectivity to Azure Blob Storage and differentiate between connection issues
     and authentication errors.
     """
     try:
-        blob_service_client = BlobServiceClient(
-            account_url=f"https://{storage_account_name}.blob.core.windows.net",
-            credential=storage_account_key,
-        )
-        container_client = blob_service_client.get_container_client(
-            container=container_name
-        )
         # Attempt to get container properties
         container_client.get_container_properties()
         return True
     except ClientAuthenticationError:
-        print("Authentication failed: Check the storage account credentials.")
+        logger.error("Authentication failed: Check the storage account credentials.")
         return False
     except ServiceRequestError:
-        print("Network error: Unable to connect to Azure Blob Storage.")
+        logger.error("Network error: Unable to connect to Azure Blob Storage.")
         return False
     except Exception as e:
-        print(f"Error connecting to Azure Blob Storage: {e}")
+        logger.error("Error connecting to Azure Blob Storage: %s", e)
         return False
 
 
-def rename_file_on_success(original_path, prefix="uploaded_at_"):
+def rename_file_on_success(original_path, timestamp, prefix="uploaded_at_"):
     """
     Rename the file to indicate a successful upload.
+    timestamp: Upload time as YYYYmmddHHMMSS, shared by the whole batch.
     """
     try:
-        new_name = os.path.join(
-            os.path.dirname(original_path),
-            f"{prefix}{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}_{os.path.basename(original_path)}",
-        )
-        os.rename(original_path, new_name)
-        print(f"File renamed to: {new_name}")
+        head, tail = os.path.split(original_path)
+        new_name = os.path.join(head, prefix + timestamp + "_" + tail)
+        os.replace(original_path, new_name)
+        logger.info("File renamed to: %s", new_name)
         return True
     except Exception as e:
-        print(f"Error renaming file {original_path}: {e}")
+        logger.error("Error renaming file %s: %s", original_path, e)
         return False
 
 
-def upload_file_to_blob(blob_client, file_path, max_retries=3, retry_delay=5):
+def compute_md5(file_path):
+    """
+    Return the MD5 digest of a file, hashed in a single call over a read-only map.
+    """
+    with open(file_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return hashlib.md5(usedforsecurity=False).digest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.md5(data, usedforsecurity=False).digest()
+
+
+def is_blob_already_uploaded(blob_client, size, content_md5):
+    """
+    Check whether the blob already exists with the given size and MD5, e.g.
+    because a previous run uploaded it but stopped before renaming the local file.
+    Blobs stored without an MD5 are matched on size alone.
     """
-    Upload a file to Azure Blob Storage with retries.
+    try:
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return False
+    except (HttpResponseError, ServiceRequestError, ServiceResponseError) as e:
+        logger.warning(
+            "Unable to check for existing blob %s: %s", blob_client.blob_name, e
+        )
+        return False
+    if properties.size != size:
+        return False
+    stored_md5 = properties.content_settings.content_md5
+    return stored_md5 is None or bytes(stored_md5) == content_md5
+
+
+def make_uploader(max_retries=3, retry_delay=5, retry_cap=60, max_concurrency=4):
+    """
+    Build an upload function with the retry and concurrency settings bound, so
+    the per-file call only takes what differs between files.
     max_retries: Number of retry attempts.
-    retry_delay: Delay between retries in seconds.
+    retry_delay: Base delay between retries in seconds, doubled on each attempt
+    and jittered by up to retry_delay.
+    retry_cap: Upper bound in seconds on the exponential part of the delay.
+    max_concurrency: Number of blocks of the file uploaded in parallel.
     """
-    retry_count = 0
-    while retry_count < max_retries:
-        try:
-            with open(file_path, "rb") as data:
-                blob_client.upload_blob(data, overwrite=True)
-            return True  # Upload succeeded
-        except Exception as e:
-            print(
-                f"Failed to upload {file_path}. Attempt {retry_count + 1} of {max_retries}. Error: {e}"
-            )
-            retry_count += 1
-            time.sleep(retry_delay)
+    block_blob = BlobType.BLOCKBLOB
+    # Service errors and transport failures on either side of the request;
+    # anything else is a bug and is not retried.
+    retryable = (HttpResponseError, ServiceRequestError, ServiceResponseError)
+
+    def upload(blob_client, file_path, content_md5=None):
+        """
+        Upload a file to Azure Blob Storage with retries.
+        content_md5: MD5 digest of the file, stored on the blob as Content-MD5.
+        """
+        content_settings = ContentSettings(content_md5=content_md5)
+        retry_count = 0
+        while retry_count < max_retries:
+            try:
+                # Map the archive read-only; the SDK still copies each block into
+                # its own bytes object (validate_content hashes every block).
+                fd = os.open(file_path, os.O_RDONLY)
+                try:
+                    length = os.fstat(fd).st_size
+                    data = mmap.mmap(fd, 0, access=mmap.ACCESS_READ) if length else b""
+                    try:
+                        blob_client.upload_blob(
+                            data,
+                            blob_type=block_blob,
+                            length=length,
+                            overwrite=True,
+                            max_concurrency=max_concurrency,
+                            content_settings=content_settings,
+                            validate_content=True,
+                        )
+                    finally:
+                        if length:
+                            data.close()
+                finally:
+                    os.close(fd)
+                return True  # Upload succeeded
+            except retryable as e:
+                logger.warning(
+                    "Failed to upload %s. Attempt %d of %d. Error: %s",
+                    file_path,
+                    retry_count + 1,
+                    max_retries,
+                    e,
+                )
+                delay = min(retry_cap, (2**retry_count) * retry_delay)
+                retry_count += 1
+                if retry_count < max_retries:
+                    time.sleep(delay + random.uniform(0, retry_delay))
+
+        logger.error("Failed to upload %s after %d attempts.", file_path, max_retries)
+        return False
 
-    print(f"Failed to upload {file_path} after {max_retries} attempts.")
-    return False
+    return upload
 
 
-def upload_files_to_blob(
-    storage_account_name,
-    storage_account_key,
-    container_name,
-    opsview_system_id,
-    directory,
+def upload_file_to_blob(
+    blob_client,
+    file_path,
     max_retries=3,
     retry_delay=5,
+    retry_cap=60,
+    max_concurrency=4,
+    content_md5=None,
 ):
-    try:
-        # Create a BlobServiceClient
-        blob_service_client = BlobServiceClient(
-            account_url=f"https://{storage_account_name}.blob.core.windows.net",
-            credential=storage_account_key,
-        )
-        container_client = blob_service_client.get_container_client(
-            container=container_name
-        )
+    """
+    Upload a single file to Azure Blob Storage with retries. See make_uploader
+    for the settings; batches should build the uploader once instead.
+    """
+    upload = make_uploader(max_retries, retry_delay, retry_cap, max_concurrency)
+    return upload(blob_client, file_path, content_md5)
+
+
+def find_files_to_upload(directory):
+    """
+    Return os.DirEntry objects for the result exports in directory.
+    """
+    with os.scandir(directory) as entries:
+        return [
+            entry
+            for entry in entries
+            if entry.name.startswith("results_export_")
+            and entry.name.endswith(".tar.gz")
+            and entry.is_file(follow_symlinks=False)
+        ]
 
-        # List files to upload
-        files_to_upload = glob.glob(f"{directory}/results_export_*.tar.gz")
 
-        for file_path in files_to_upload:
-            blob_name = f"{opsview_system_id}/{datetime.datetime.now().strftime('%Y%m%d')}/{os.path.basename(file_path)}"
+def upload_files_to_blob(
+    container_client,
+    opsview_system_id,
+    files_to_upload,
+    uploader,
+    max_workers=8,
+):
+    """
+    Upload the given result exports (os.DirEntry objects) with uploader, as
+    built by make_uploader, max_workers files at a time, then rename the
+    uploaded ones in a single sweep.
+    """
+    try:
+        # Every file in the batch lands in the same date folder and gets the
+        # same upload timestamp, even if the batch runs past midnight.
+        now = time.localtime()
+        date_prefix = time.strftime("%Y%m%d", now)
+        timestamp = time.strftime("%Y%m%d%H%M%S", now)
+
+        def _process_one(entry):
+            """
+            Upload one file with retries. Returns its blob name on success.
+            """
+            file_path = entry.path
+            blob_name = f"{opsview_system_id}/{date_prefix}/{entry.name}"
+            # get_blob_client reuses the container client's policies and
+            # transport; only the lightweight BlobClient wrapper is per file.
             blob_client = container_client.get_blob_client(blob_name)
 
-            # Upload file with retries
-            if upload_file_to_blob(
-                blob_client, file_path, max_retries=max_retries, retry_delay=retry_delay
-            ):
-                # Rename the file to mark as uploaded
-                if rename_file_on_success(file_path):
-                    print(f"Uploaded and renamed {file_path} to {blob_name}")
-                else:
-                    print(f"Uploaded but failed to rename {file_path}")
+            content_md5 = compute_md5(file_path)
+            if is_blob_already_uploaded(blob_client, entry.stat().st_size, content_md5):
+                logger.info("%s is already uploaded as %s", file_path, blob_name)
+                return blob_name
+
+            if uploader(blob_client, file_path, content_md5):
+                return blob_name
+            logger.error("Skipping %s due to repeated upload failures.", file_path)
+            return None
+
+        # Let every file run to completion; one file raising must not abandon
+        # the rest of the batch.
+        uploaded = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_process_one, entry): entry.path
+                for entry in files_to_upload
+            }
+            for future in as_completed(futures):
+                file_path = futures[future]
+                try:
+                    blob_name = future.result()
+                except Exception as e:
+                    logger.error("Error processing %s: %s", file_path, e)
+                    continue
+                if blob_name is not None:
+                    uploaded.append((file_path, blob_name))
+
+        # Rename the files to mark them as uploaded
+        rename = functools.partial(
+            rename_file_on_success, timestamp=timestamp, prefix="uploaded_at_"
+        )
+        for file_path, blob_name in uploaded:
+            if rename(file_path):
+                logger.info("Uploaded and renamed %s to %s", file_path, blob_name)
             else:
-                print(f"Skipping {file_path} due to repeated upload failures.")
+                logger.warning("Uploaded but failed to rename %s", file_path)
+
+        return True
 
     except Exception as e:
-        print(f"Error uploading files to Azure Blob Storage: {e}")
+        logger.error("Error uploading files to Azure Blob Storage: %s", e)
         return False
 
 
@@ -170,6 +453,12 @@ def main():
         help="Azure Storage Account key",
         required=False,
     )
+    parser.add_argument(
+        "--use_aad",
+        action="store_true",
+        help="Authenticate with Azure AD (DefaultAzureCredential) instead of the account key; requires azure-identity",
+        required=False,
+    )
     parser.add_argument(
         "--container_name",
         type=str,
@@ -200,6 +489,34 @@ def main():
         help="Delay between upload retries in seconds",
         required=False,
     )
+    parser.add_argument(
+        "--retry_cap",
+        type=int,
+        default=60,
+        help="Maximum backoff between upload retries in seconds",
+        required=False,
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=8,
+        help="Number of files to upload in parallel",
+        required=False,
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=4,
+        help="Number of blocks of a single file to upload in parallel",
+        required=False,
+    )
+    parser.add_argument(
+        "--block_size_mb",
+        type=int,
+        default=8,
+        help="Size in MiB of each block staged during an upload",
+        required=False,
+    )
     parser.add_argument(
         "--config", type=str, help="Path to YAML config file", required=False
     )
@@ -212,6 +529,8 @@ def main():
 
     args = parser.parse_args()
 
+    _configure_logging()
+
     if args.create_example_config:
         success = create_example_config_file(args.create_example_config)
         return 0 if success else 1
@@ -220,7 +539,8 @@ def main():
     if args.config:
         config = load_config_from_yaml(args.config)
         storage_account_name = config["storage_account_name"]
-        storage_account_key = config["storage_account_key"]
+        storage_account_key = config.get("storage_account_key")
+        use_aad = config.get("use_aad", False)
         container_name = config["container_name"]
         opsview_system_id = config["opsview_system_id"]
         directory = config.get(
@@ -228,43 +548,78 @@ def main():
         )  # Default to '/var/log/opsview' if not specified
         max_retries = config.get("max_retries", 3)
         retry_delay = config.get("retry_delay", 5)
+        retry_cap = config.get("retry_cap", 60)
+        max_workers = config.get("max_workers", 8)
+        max_concurrency = config.get("max_concurrency", 4)
+        block_size_mb = config.get("block_size_mb", 8)
     else:
         storage_account_name = args.storage_account_name
         storage_account_key = args.storage_account_key
+        use_aad = args.use_aad
         container_name = args.container_name
         opsview_system_id = args.opsview_system_id
         directory = args.directory
         max_retries = args.max_retries
         retry_delay = args.retry_delay
+        retry_cap = args.retry_cap
+        max_workers = args.max_workers
+        max_concurrency = args.max_concurrency
+        block_size_mb = args.block_size_mb
 
     # Validation
     required_params = [
         storage_account_name,
-        storage_account_key,
         container_name,
         opsview_system_id,
     ]
+    if not use_aad:
+        required_params.append(storage_account_key)
     if any(param is None or param == "" for param in required_params):
-        print(
+        logger.error(
             "Error: Missing required parameters. Ensure all parameters are provided either via command line or config file."
         )
         return 1
 
+    # List files to upload; an idle run has nothing to check connectivity for
+    try:
+        files_to_upload = find_files_to_upload(directory)
+    except OSError as e:
+        logger.error("Error listing files in %s: %s", directory, e)
+        return 1
+    if not files_to_upload:
+        return 0
+
+    socket.getaddrinfo = _cached_getaddrinfo
+
+    try:
+        blob_service_client = _build_service_client(
+            storage_account_name,
+            storage_account_key,
+            block_size_mb=block_size_mb,
+            use_aad=use_aad,
+            connection_pool_size=max_workers * max_concurrency,
+        )
+        container_client = blob_service_client.get_container_client(
+            container=container_name
+        )
+    except ImportError as e:
+        logger.error("Error: %s", e)
+        return 1
+    except Exception as e:
+        logger.error("Error connecting to Azure Blob Storage: %s", e)
+        return 1
+
     # Check for Azure Blob Storage connectivity
-    if not is_blob_service_available(
-        storage_account_name, storage_account_key, container_name
-    ):
-        print("Unable to connect to Azure Blob Storage. Exiting.")
+    if not is_blob_service_available(container_client):
+        logger.error("Unable to connect to Azure Blob Storage. Exiting.")
         return 1
 
     success = upload_files_to_blob(
-        storage_account_name,
-        storage_account_key,
-        container_name,
+        container_client,
         opsview_system_id,
-        directory,
-        max_retries=max_retries,
-        retry_delay=retry_delay,
+        files_to_upload,
+        make_uploader(max_retries, retry_delay, retry_cap, max_concurrency),
+        max_workers=max_workers,
     )
 
     if not success: